@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Send benchmark for fragmented hellos.
+
+Sends the same fragmented hello with each strategy to a local sink and
+reports how long it takes until the last byte of the hello reaches the sink,
+i.e. the time to first byte that fragmentation adds, side by side.
+
+Usage: python benchmarks/send.py [--runs N] [--pacing US]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "src"))
+
+import main as nodpi  # noqa: E402
+
+HOST = "127.0.0.1"
+
+# Заголовок TLS-записи и тело ClientHello с SNI примерно реального размера
+HEAD = bytes.fromhex("1603010200")
+DATA = b"\x01\x00\x01\xfc\x03\x03" + bytes(58) + b"\x00youtube.com" + bytes(440)
+
+
+class Sink:
+    """
+    Accept one connection at a time and resolve `done` with the time the
+    last chunk arrived once the sender closes.
+    """
+
+    def __init__(self):
+        self.done = None
+
+    async def handle(self, reader, writer):
+        last = None
+        while await reader.read(65536):
+            last = time.perf_counter()
+        self.done.set_result(last)
+        writer.close()
+
+
+async def measure(mode, pacing, runs, port, sink):
+    proxy = nodpi.ProxyServer.__new__(nodpi.ProxyServer)
+    proxy.no_blacklist = True
+    proxy.verbose = False
+    proxy.quiet = True
+    proxy.blocked_connections = 0
+    proxy.scheduler = nodpi.SendScheduler(mode, pacing)
+
+    samples = []
+    for i in range(runs):
+        reader = asyncio.StreamReader()
+        reader.feed_data(HEAD + DATA)
+        reader.feed_eof()
+        _, writer = await asyncio.open_connection(HOST, port)
+        sink.done = asyncio.get_running_loop().create_future()
+
+        # Одинаковое разбиение для всех стратегий
+        random.seed(i)
+        start = time.perf_counter()
+        await proxy.fragment_data(reader, writer)
+        writer.close()
+        samples.append(await sink.done - start)
+    return sorted(samples)
+
+
+async def run(runs, pacing):
+    sink = Sink()
+    server = await asyncio.start_server(sink.handle, HOST, 0)
+    port = server.sockets[0].getsockname()[1]
+
+    strategies = [("joined", 0), ("segments", 0)]
+    if pacing:
+        strategies.append(("segments", pacing))
+
+    for mode, pace in strategies:
+        samples = await measure(mode, pace, runs, port, sink)
+        name = mode + (f" +{pace}us" if pace else "")
+        print(
+            f"{name:<18} median {samples[len(samples) // 2] * 1e6:8.1f} us, "
+            f"p90 {samples[int(len(samples) * 0.9)] * 1e6:8.1f} us"
+        )
+    server.close()
+    await server.wait_closed()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=200, help="Hellos per strategy")
+    parser.add_argument(
+        "--pacing", type=int, default=100,
+        help="Also measure segments mode with this pacing in microseconds (0 to skip)",
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.runs, args.pacing))
+
+
+if __name__ == "__main__":
+    main()
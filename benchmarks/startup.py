@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for NoDPI.
+
+Reports the import cost of src/main.py (via -X importtime) and the time
+from process start until the proxy accepts its first connection, for each
+available event loop.
+
+Usage: python benchmarks/startup.py [--runs N]
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "src", "main.py")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def import_cost():
+    """
+    Return (total microseconds, top imports) for `import main`.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.join(ROOT, "src"),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), name.rstrip()))
+    # Дочерние модули печатаются перед родителем: поддерево main - это
+    # строки между предыдущим модулем верхнего уровня и самой main
+    end = next(i for i, (_, name) in enumerate(rows) if name.strip() == "main")
+    start = end
+    while start > 0 and rows[start - 1][1].startswith("   "):
+        start -= 1
+    total = rows[end][0]
+    # Прямые зависимости main имеют отступ в три пробела
+    top = sorted(
+        (r for r in rows[start:end] if r[1].startswith("   ") and r[1][3] != " "),
+        reverse=True,
+    )[:5]
+    return total, top
+
+
+def time_to_accept(loop, port):
+    """
+    Seconds from spawning the proxy until it accepts a TCP connection.
+    """
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, MAIN, "--port", str(port), "--no_blacklist", "-q",
+         "--loop", loop],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                return time.perf_counter() - start
+            except OSError:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"proxy exited with code {proc.returncode}")
+                time.sleep(0.001)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="Runs per loop")
+    args = parser.parse_args()
+
+    total, top = import_cost()
+    print(f"import main: {total / 1000:.1f} ms")
+    for cumulative, name in top:
+        print(f"  {name.strip():<24} {cumulative / 1000:.1f} ms")
+
+    loops = ["asyncio"]
+    try:
+        import uvloop  # noqa: F401
+        loops.append("uvloop")
+    except ImportError:
+        print("uvloop is not installed, skipping")
+
+    for loop in loops:
+        samples = sorted(time_to_accept(loop, free_port()) for _ in range(args.runs))
+        print(
+            f"startup ({loop}): median {samples[len(samples) // 2] * 1000:.1f} ms, "
+            f"min {samples[0] * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Check the upstream pool against local stand-in proxies.
+
+Starts in-process HTTP and SOCKS5 stand-ins (working, refusing and hanging
+ones) and an echo target, then checks failover, ejection after max_fails,
+re-admission by the health check, warm connection reuse and the 502 path.
+Exits with a non-zero status if any check fails.
+
+Usage: python benchmarks/upstreams.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "src"))
+
+import main  # noqa: E402
+
+HOST = "127.0.0.1"
+TIMEOUT = 0.5
+
+
+async def relay(reader, writer):
+    try:
+        while data := await reader.read(65536):
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+async def tunnel(reader, writer, host, port):
+    remote_reader, remote_writer = await asyncio.open_connection(host, port)
+    await asyncio.gather(
+        relay(reader, remote_writer), relay(remote_reader, writer)
+    )
+
+
+class StandIn:
+    """
+    A stand-in proxy. `mode` is "ok", "refuse" (502 / SOCKS5 error reply)
+    or "hang" (accepts TCP and never answers).
+    """
+
+    def __init__(self, scheme, mode="ok"):
+        self.scheme = scheme
+        self.mode = mode
+        self.server = None
+        self.port = None
+
+    @property
+    def spec(self):
+        return f"{self.scheme}://{HOST}:{self.port}"
+
+    async def start(self, port=0):
+        self.server = await asyncio.start_server(self.handle, HOST, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            if self.mode == "hang":
+                await reader.read()
+            elif self.scheme == "http":
+                await self.handle_http(reader, writer)
+            else:
+                await self.handle_socks5(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_http(self, reader, writer):
+        request = await reader.readuntil(b"\r\n\r\n")
+        method, target = request.split(b" ")[:2]
+        if method != b"CONNECT":
+            writer.write(b"HTTP/1.1 400 Bad Request\r\n\r\n")
+        elif self.mode == "refuse":
+            writer.write(b"HTTP/1.1 502 Bad Gateway\r\n\r\n")
+        else:
+            host, port = target.decode().rsplit(":", 1)
+            writer.write(b"HTTP/1.1 200 Connection Established\r\n\r\n")
+            await tunnel(reader, writer, host, int(port))
+
+    async def handle_socks5(self, reader, writer):
+        await reader.readexactly(3)
+        writer.write(b"\x05\x00")
+        await writer.drain()
+        head = await reader.readexactly(5)
+        host = (await reader.readexactly(head[4])).decode()
+        port = int.from_bytes(await reader.readexactly(2), "big")
+        code = 5 if self.mode == "refuse" else 0
+        writer.write(b"\x05" + bytes([code]) + b"\x00\x01" + bytes(6))
+        await writer.drain()
+        if not code:
+            await tunnel(reader, writer, host, port)
+
+
+async def free_port():
+    server = await asyncio.start_server(lambda r, w: None, HOST, 0)
+    port = server.sockets[0].getsockname()[1]
+    server.close()
+    await server.wait_closed()
+    return port
+
+
+async def echo_through(pool, target_port):
+    reader, writer, upstream = await pool.open_connection(HOST, target_port)
+    writer.write(b"ping")
+    await writer.drain()
+    data = await reader.readexactly(4)
+    writer.close()
+    pool.release(upstream)
+    return data, upstream
+
+
+async def check_failover(target_port):
+    good = await StandIn("http").start()
+    dead_port = await free_port()
+    pool = main.UpstreamPool(
+        [f"http://{HOST}:{dead_port}", good.spec], max_fails=2, timeout=TIMEOUT
+    )
+    dead = pool.upstreams[0]
+    # Порядок при равной нагрузке случайный: гоняем запросы, пока мертвый
+    # апстрим не наберет max_fails. Каждый запрос должен пройти через живой
+    for _ in range(50):
+        data, upstream = await echo_through(pool, target_port)
+        assert data == b"ping" and upstream.spec == good.spec
+        if not dead.healthy:
+            break
+    assert not dead.healthy and dead.fails >= 2, (dead.healthy, dead.fails)
+
+    # Апстрим поднялся - проверка здоровья возвращает его в пул
+    revived = await StandIn("http").start(dead_port)
+    pool.health_interval = 0.05
+    pool.start()
+    await asyncio.sleep(0.2)
+    pool.stop()
+    assert dead.healthy and dead.fails == 0
+    await revived.stop()
+    await good.stop()
+
+
+async def check_hanging_socks5():
+    hanging = await StandIn("socks5", "hang").start()
+    pool = main.UpstreamPool([hanging.spec], max_fails=2, timeout=TIMEOUT)
+    upstream = pool.upstreams[0]
+    for _ in range(2):
+        try:
+            await pool.open_connection(HOST, 1)
+        except main.UpstreamError:
+            pass
+        else:
+            raise AssertionError("hanging SOCKS5 upstream accepted")
+    assert not upstream.healthy
+    assert not await pool.probe(upstream)
+    await hanging.stop()
+
+
+async def check_refusal(target_port):
+    refusing = await StandIn("http", "refuse").start()
+    socks_refusing = await StandIn("socks5", "refuse").start()
+    pool = main.UpstreamPool(
+        [refusing.spec, socks_refusing.spec], timeout=TIMEOUT
+    )
+    for _ in range(4):
+        try:
+            await pool.open_connection(HOST, target_port)
+        except main.DestinationError:
+            pass
+        else:
+            raise AssertionError("refused CONNECT succeeded")
+    for upstream in pool.upstreams:
+        assert upstream.healthy and upstream.fails == 0 and upstream.active == 0
+
+    # Клиент прокси получает 502
+    proxy_port = await free_port()
+    proxy = main.ProxyServer(
+        HOST, proxy_port, None, None, None, True, True, False,
+        main.UpstreamPool([refusing.spec], timeout=TIMEOUT),
+    )
+    task = asyncio.create_task(proxy.run())
+    await asyncio.sleep(0.1)
+    reader, writer = await asyncio.open_connection(HOST, proxy_port)
+    writer.write(b"CONNECT dead.invalid:443 HTTP/1.1\r\n\r\n")
+    await writer.drain()
+    status = await reader.readline()
+    writer.close()
+    assert status.startswith(b"HTTP/1.1 502"), status
+    task.cancel()
+    await proxy.shutdown()
+    await refusing.stop()
+    await socks_refusing.stop()
+
+
+async def check_warm(target_port):
+    good = await StandIn("socks5").start()
+    pool = main.UpstreamPool([good.spec], warm=1, timeout=TIMEOUT)
+    upstream = pool.upstreams[0]
+    await pool.fill_warm(upstream)
+    assert len(upstream.warm) == 1
+    warm_writer = upstream.warm[0][1]
+    start = time.perf_counter()
+    reader, writer, _ = await pool.open_connection(HOST, target_port)
+    elapsed = time.perf_counter() - start
+    # Запрос ушел по заранее открытому соединению
+    assert writer is warm_writer
+    writer.write(b"ping")
+    assert await reader.readexactly(4) == b"ping"
+    writer.close()
+    pool.release(upstream)
+    print(f"  warm request: {elapsed * 1000:.2f} ms")
+    pool.stop()
+    await good.stop()
+
+
+async def check_direct():
+    pool = main.UpstreamPool([f"direct://{HOST}", "direct://192.0.2.1"])
+    assert await pool.probe(pool.upstreams[0])
+    assert not await pool.probe(pool.upstreams[1])
+
+
+async def run():
+    target = await asyncio.start_server(relay, HOST, 0)
+    target_port = target.sockets[0].getsockname()[1]
+
+    checks = [
+        ("failover, ejection and re-admission", check_failover(target_port)),
+        ("hanging SOCKS5 upstream is ejected", check_hanging_socks5()),
+        ("refused CONNECT returns 502 without failover", check_refusal(target_port)),
+        ("warm connection reuse", check_warm(target_port)),
+        ("direct upstream probe", check_direct()),
+    ]
+    failed = 0
+    for name, check in checks:
+        try:
+            await check
+            print(f"ok   {name}")
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {name}: {e!r}")
+    target.close()
+    return failed
+
+
+if __name__ == "__main__":
+    sys.exit(1 if asyncio.run(run()) else 0)
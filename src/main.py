@@ -2,28 +2,19 @@
 
 import argparse
 import asyncio
+import errno
 import random
 import logging
 import os
+import socket
 import sys
+import threading
 from datetime import datetime
 import time
 import traceback
 
-import winreg
-import ctypes
-import ctypes.wintypes
-import win32api
-
 __version__ = "1.8.2"
 
-os.system("")
-
-CTRL_C_EVENT = 0
-CTRL_BREAK_EVENT = 1
-CTRL_CLOSE_EVENT = 2
-CTRL_LOGOFF_EVENT = 5
-CTRL_SHUTDOWN_EVENT = 6
 
 class ConnectionInfo:
     def __init__(self, src_ip, dst_domain, method):
@@ -33,11 +24,485 @@ class ConnectionInfo:
         self.start_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.traffic_in = 0
         self.traffic_out = 0
+        self.upstream = None
+
+
+class UpstreamError(ConnectionError):
+    """
+    The upstream itself failed: unreachable, timed out or spoke the wrong
+    protocol. Counts against the upstream and triggers failover.
+    """
+
+
+class DestinationError(ConnectionError):
+    """
+    The upstream works but could not reach the destination. Returned to the
+    client as is, without failover.
+    """
+
+
+class Upstream:
+    """
+    A single egress route: an HTTP/SOCKS5 proxy or a local source address.
+
+    Parameters:
+        spec (str): http://host:port, socks5://host:port or direct://source_ip
+    """
+
+    EWMA_ALPHA = 0.3
+    WARM_MAX_AGE = 30
+
+    def __init__(self, spec):
+        scheme, sep, address = spec.partition("://")
+        if not sep or scheme not in ("http", "socks5", "direct"):
+            raise ValueError(f"Unsupported upstream: {spec}")
+
+        self.spec = spec
+        self.scheme = scheme
+        if scheme == "direct":
+            self.host = address.strip("[]")
+            self.port = 0
+        else:
+            host, _, port = address.rpartition(":")
+            if not host or not port.isdigit():
+                raise ValueError(f"Upstream {spec} must be host:port")
+            self.host = host.strip("[]")
+            self.port = int(port)
+
+        self.active = 0
+        self.fails = 0
+        self.healthy = True
+        self.latency = None
+        self.warm = []
+
+    def observe(self, latency):
+        """
+        Feed a connection setup time (in seconds) into the EWMA latency.
+        """
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.EWMA_ALPHA * (latency - self.latency)
+
+    async def dial(self, timeout):
+        """
+        Open a TCP connection to the upstream proxy itself.
+        """
+        return await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout
+        )
+
+    def take_warm(self):
+        """
+        Pop a pre-established connection that is still usable, if any.
+        """
+        now = time.monotonic()
+        while self.warm:
+            reader, writer, created = self.warm.pop()
+            if (
+                now - created < self.WARM_MAX_AGE
+                and not reader.at_eof()
+                and not writer.is_closing()
+            ):
+                return reader, writer
+            writer.close()
+        return None
+
+    def drop_warm(self):
+        for _, writer, _ in self.warm:
+            writer.close()
+        self.warm = []
+
+    async def open_connection(self, host, port, timeout):
+        """
+        Open a connection to host:port through this upstream.
+
+        Returns:
+            tuple: (asyncio.StreamReader, asyncio.StreamWriter)
+        """
+        if self.scheme == "direct":
+            try:
+                return await asyncio.wait_for(
+                    asyncio.open_connection(
+                        host, port, local_addr=(self.host, 0)),
+                    timeout,
+                )
+            except OSError as e:
+                if e.errno == errno.EADDRNOTAVAIL:
+                    raise UpstreamError(f"{self.spec}: {e}") from e
+                raise DestinationError(f"{host}:{port}: {e}") from e
+            except asyncio.TimeoutError as e:
+                raise DestinationError(f"{host}:{port}: timed out") from e
+
+        warm = self.take_warm()
+        if warm is not None:
+            try:
+                return await self.handshake(*warm, host, port, timeout)
+            except UpstreamError:
+                # Прокси мог уже закрыть простаивающее соединение со своей
+                # стороны - пробуем еще раз на свежем
+                pass
+
+        try:
+            reader, writer = await self.dial(timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise UpstreamError(f"{self.spec}: {e!r}") from e
+        return await self.handshake(reader, writer, host, port, timeout)
+
+    async def handshake(self, reader, writer, host, port, timeout):
+        """
+        Ask the upstream proxy to connect to host:port over an open connection.
+
+        Raises:
+            UpstreamError: The proxy closed the connection or answered garbage
+            DestinationError: The proxy refused or could not reach host:port
+        """
+        try:
+            if self.scheme == "socks5":
+                # Ответ на приветствие не зависит от цели: молчание здесь -
+                # проблема самого прокси
+                try:
+                    await asyncio.wait_for(self.socks5_greet(reader, writer), timeout)
+                except asyncio.TimeoutError as e:
+                    raise UpstreamError(
+                        f"{self.spec}: no reply to SOCKS5 greeting") from e
+                connect = self.socks5_connect
+            else:
+                connect = self.http_connect
+            await asyncio.wait_for(connect(reader, writer, host, port), timeout)
+        except DestinationError:
+            writer.close()
+            raise
+        except asyncio.TimeoutError as e:
+            # Соединение с прокси уже есть, значит медленно отвечает цель
+            writer.close()
+            raise DestinationError(f"{host}:{port}: timed out via {self.spec}") from e
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+            writer.close()
+            if isinstance(e, UpstreamError):
+                raise
+            raise UpstreamError(f"{self.spec}: {e!r}") from e
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    @staticmethod
+    async def http_connect(reader, writer, host, port):
+        target = f"{host}:{port}".encode()
+        writer.write(
+            b"CONNECT " + target + b" HTTP/1.1\r\nHost: " + target + b"\r\n\r\n"
+        )
+        await writer.drain()
+        response = await reader.readuntil(b"\r\n\r\n")
+        status = response.split(b" ", 2)
+        if len(status) < 2 or not status[0].startswith(b"HTTP/"):
+            raise UpstreamError(
+                f"Not an HTTP proxy response: {response.splitlines()[0]!r}")
+        if status[1] != b"200":
+            raise DestinationError(
+                f"Upstream refused CONNECT: {response.splitlines()[0]!r}")
+
+    @staticmethod
+    async def socks5_greet(reader, writer):
+        writer.write(b"\x05\x01\x00")
+        await writer.drain()
+        if await reader.readexactly(2) != b"\x05\x00":
+            raise UpstreamError("SOCKS5 upstream requires authentication")
+
+    @staticmethod
+    async def socks5_connect(reader, writer, host, port):
+        host_bytes = host.encode()
+        writer.write(
+            b"\x05\x01\x00\x03"
+            + len(host_bytes).to_bytes(1, "big")
+            + host_bytes
+            + port.to_bytes(2, "big")
+        )
+        await writer.drain()
+        reply = await reader.readexactly(4)
+        if reply[0] != 5:
+            raise UpstreamError(f"Not a SOCKS5 reply: {reply!r}")
+        if reply[1] != 0:
+            raise DestinationError(f"SOCKS5 upstream error code {reply[1]}")
+
+        # Пропускаем BND.ADDR и BND.PORT
+        if reply[3] == 1:
+            await reader.readexactly(4 + 2)
+        elif reply[3] == 4:
+            await reader.readexactly(16 + 2)
+        else:
+            length = (await reader.readexactly(1))[0]
+            await reader.readexactly(length + 2)
+
+
+    async def ping(self, reader, writer):
+        """
+        Check that the proxy speaks its protocol over an open connection.
+
+        Raises:
+            UpstreamError: The proxy answered something unexpected
+        """
+        if self.scheme == "socks5":
+            await self.socks5_greet(reader, writer)
+            return
+        # Без Host: прокси ответит ошибкой, но не пойдет никуда дальше
+        writer.write(b"HEAD / HTTP/1.0\r\n\r\n")
+        await writer.drain()
+        status = await reader.readline()
+        if not status.startswith(b"HTTP/"):
+            raise UpstreamError(f"Not an HTTP proxy response: {status!r}")
+
+    def can_bind(self):
+        """
+        Check that the source address of a direct upstream is still assigned
+        to this host.
+        """
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        try:
+            with socket.socket(family, socket.SOCK_STREAM) as sock:
+                sock.bind((self.host, 0))
+        except OSError:
+            return False
+        return True
+
+
+class UpstreamPool:
+    """
+    Spread outgoing connections across several upstreams.
+
+    Upstreams are picked by least active connections or by EWMA setup latency
+    weighted by load. An upstream is ejected after `max_fails` consecutive
+    failures and comes back once a background health check succeeds.
+
+    Parameters:
+        specs (list): Upstream specifications, see `Upstream`
+        balance (str): "least_conn" or "ewma"
+        health_interval (float): Seconds between health checks
+        warm (int): Number of idle connections kept open to each proxy
+        max_fails (int): Consecutive failures before an upstream is ejected
+        timeout (float): Connect and handshake timeout in seconds
+    """
+
+    def __init__(self, specs, balance="least_conn", health_interval=10,
+                 warm=0, max_fails=2, timeout=5):
+        self.upstreams = [Upstream(spec) for spec in specs]
+        self.balance = balance
+        self.health_interval = health_interval
+        self.warm = warm
+        self.max_fails = max_fails
+        self.timeout = timeout
+        self.tasks = []
+
+    def start(self):
+        self.tasks.append(asyncio.create_task(self.health_check()))
+
+    def stop(self):
+        for task in list(self.tasks):
+            task.cancel()
+        for upstream in self.upstreams:
+            upstream.drop_warm()
+
+    def candidates(self):
+        """
+        Return upstreams ordered from most to least preferred.
+        """
+        pool = [u for u in self.upstreams if u.healthy] or list(self.upstreams)
+        random.shuffle(pool)
+        if self.balance == "ewma":
+            # Неизмеренные апстримы пробуем первыми
+            return sorted(
+                pool,
+                key=lambda u: (u.latency or 0) * (u.active + 1),
+            )
+        return sorted(pool, key=lambda u: u.active)
+
+    async def open_connection(self, host, port):
+        """
+        Open a connection to host:port via the best available upstream,
+        falling over to the next one if the upstream itself fails.
+        A DestinationError is raised at once, without failover.
+
+        Returns:
+            tuple: (asyncio.StreamReader, asyncio.StreamWriter, Upstream)
+        """
+        error = None
+        for upstream in self.candidates():
+            upstream.active += 1
+            start = time.monotonic()
+            try:
+                reader, writer = await upstream.open_connection(
+                    host, port, self.timeout
+                )
+            except UpstreamError as e:
+                upstream.active -= 1
+                self.mark_failed(upstream)
+                error = e
+                continue
+            except BaseException:
+                upstream.active -= 1
+                raise
+            upstream.observe(time.monotonic() - start)
+            upstream.fails = 0
+            if self.warm and upstream.scheme != "direct":
+                task = asyncio.create_task(self.fill_warm(upstream))
+                self.tasks.append(task)
+                task.add_done_callback(self.tasks.remove)
+            return reader, writer, upstream
+        raise UpstreamError(f"All upstreams failed: {error}")
+
+    def release(self, upstream):
+        if upstream is not None:
+            upstream.active -= 1
+
+    def mark_failed(self, upstream):
+        upstream.fails += 1
+        if upstream.fails >= self.max_fails:
+            upstream.healthy = False
+            upstream.drop_warm()
+
+    async def fill_warm(self, upstream):
+        """
+        Top up the idle connections kept open to an upstream proxy.
+        """
+        while upstream.healthy and len(upstream.warm) < self.warm:
+            try:
+                reader, writer = await upstream.dial(self.timeout)
+            except (OSError, asyncio.TimeoutError):
+                self.mark_failed(upstream)
+                return
+            if len(upstream.warm) >= self.warm:
+                writer.close()
+                return
+            upstream.warm.append((reader, writer, time.monotonic()))
+
+    async def probe(self, upstream):
+        if upstream.scheme == "direct":
+            return upstream.can_bind()
+        start = time.monotonic()
+        try:
+            reader, writer = await upstream.dial(self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        try:
+            await asyncio.wait_for(upstream.ping(reader, writer), self.timeout)
+        except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            return False
+        finally:
+            writer.close()
+        upstream.observe(time.monotonic() - start)
+        return True
+
+    async def health_check(self):
+        while True:
+            results = await asyncio.gather(
+                *(self.probe(u) for u in self.upstreams)
+            )
+            for upstream, ok in zip(self.upstreams, results):
+                if ok:
+                    upstream.healthy = True
+                    upstream.fails = 0
+                else:
+                    upstream.fails = self.max_fails
+                    upstream.healthy = False
+                    upstream.drop_warm()
+            if self.warm:
+                await asyncio.gather(
+                    *(self.fill_warm(u) for u in self.upstreams
+                      if u.healthy and u.scheme != "direct")
+                )
+            await asyncio.sleep(self.health_interval)
+
+
+class SendScheduler:
+    """
+    Send fabricated TLS records to the server.
+
+    In "joined" mode all records are written with a single write, as before.
+    In "segments" mode TCP_NODELAY is enabled and every record is handed to
+    the transport separately, so each one leaves as its own TCP segment,
+    optionally with a pause between records. While its buffer is empty the
+    transport passes each write straight to the non-blocking socket; drain()
+    is awaited only when the kernel did not take a record whole, so that the
+    next record is not appended to its remainder.
+
+    Parameters:
+        mode (str): "joined" or "segments"
+        pacing (int): Pause between records in microseconds (segments only)
+        sndbuf (int): SO_SNDBUF for connections whose hello is fragmented
+    """
+
+    # Паузы короче этой выдерживаем, уступая цикл: таймеры цикла грубее
+    SLEEP_LIMIT = 0.001
+
+    def __init__(self, mode="joined", pacing=0, sndbuf=None):
+        self.mode = mode
+        self.pacing = pacing / 1_000_000
+        self.sndbuf = sndbuf
+        # strategy -> [sends, total seconds]
+        self.stats = {}
+
+    def tune(self, writer):
+        """
+        Apply socket options to an established connection.
+
+        Raises:
+            OSError: The platform rejected an option
+        """
+        sock = writer.get_extra_info("socket")
+        if sock is None:
+            return
+        if self.mode == "segments":
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.sndbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+
+    async def pause(self):
+        if self.pacing >= self.SLEEP_LIMIT:
+            await asyncio.sleep(self.pacing)
+            return
+        deadline = time.perf_counter() + self.pacing
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(0)
+
+    async def send(self, writer, parts):
+        """
+        Send the records and account the time spent under the current mode.
+
+        Parameters:
+            writer (asyncio.StreamWriter): The writer to write to
+            parts (list): TLS records to send
+        """
+        start = time.perf_counter()
+
+        if self.mode == "joined":
+            writer.write(b"".join(parts))
+        else:
+            transport = writer.transport
+            low, high = transport.get_write_buffer_limits()
+            # С high=0 drain() ждет, пока буфер транспорта не опустеет,
+            # иначе следующая запись склеилась бы с остатком предыдущей
+            transport.set_write_buffer_limits(high=0)
+            try:
+                for i, part in enumerate(parts):
+                    if i and self.pacing:
+                        await self.pause()
+                    writer.write(part)
+                    if transport.get_write_buffer_size():
+                        await writer.drain()
+            finally:
+                transport.set_write_buffer_limits(high, low)
+        await writer.drain()
+
+        stat = self.stats.setdefault(self.mode, [0, 0.0])
+        stat[0] += 1
+        stat[1] += time.perf_counter() - start
 
 
 class ProxyServer:
 
-    def __init__(self, host, port, blacklist, log_access, log_err, no_blacklist, quiet, verbose):
+    def __init__(self, host, port, blacklist, log_access, log_err, no_blacklist, quiet, verbose,
+                 upstreams=None, scheduler=None, primary=None, reuse_port=False, sock=None):
 
         self.host = host
         self.port = port
@@ -47,6 +512,10 @@ class ProxyServer:
         self.no_blacklist = no_blacklist
         self.quiet = quiet
         self.verbose = verbose
+        self.upstreams = upstreams
+        self.scheduler = scheduler or SendScheduler()
+        self.reuse_port = reuse_port
+        self.sock = sock
 
         self.logger = logging.getLogger(__name__)
         self.logging_errors = None
@@ -67,12 +536,23 @@ class ProxyServer:
         self.connections_lock = asyncio.Lock()
         self.tasks_lock = asyncio.Lock()
 
-        self.blocked = []
+        self.blocked = ()
         self.tasks = []
         self.server = None
 
-        self.setup_logging()
-        self.load_blacklist()
+        # Серверы, чья статистика суммируется в display_stats. Каждый
+        # меняет только свои счетчики, поэтому блокировки не нужны
+        self.workers = [self]
+
+        if primary is None:
+            self.setup_logging()
+            self.load_blacklist()
+        else:
+            # Воркер в другом потоке: общий неизменяемый blacklist и логгер
+            self.blocked = primary.blocked
+            self.logging_errors = primary.logging_errors
+            self.logging_access = primary.logging_access
+            primary.workers.append(self)
 
     def print(self, *args, **kwargs):
         """
@@ -84,31 +564,6 @@ class ProxyServer:
         if not self.quiet:
             print(*args, **kwargs)
 
-    def set_proxy(self, enable: bool, proxy: str = "127.0.0.1:8881"):
-        INTERNET_SETTINGS = r"Software\Microsoft\Windows\CurrentVersion\Internet Settings"
-        key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, INTERNET_SETTINGS, 0, winreg.KEY_SET_VALUE)
-
-        winreg.SetValueEx(key, "ProxyEnable", 0, winreg.REG_DWORD, 1 if enable else 0)
-        if enable:
-            winreg.SetValueEx(key, "ProxyServer", 0, winreg.REG_SZ, proxy)
-        winreg.CloseKey(key)
-
-        INTERNET_OPTION_SETTINGS_CHANGED = 39
-        INTERNET_OPTION_REFRESH = 37
-
-        internet_set_option = ctypes.windll.Wininet.InternetSetOptionW
-
-        # Уведомить систему о том, что настройки были изменены
-        internet_set_option(0, INTERNET_OPTION_SETTINGS_CHANGED, 0, 0)
-        internet_set_option(0, INTERNET_OPTION_REFRESH, 0, 0)
-
-    def on_exit(self, dwCtrlType):
-        if dwCtrlType == CTRL_CLOSE_EVENT:
-            self.set_proxy(False)
-            self.shutdown()
-            return True
-        return False
-
     def setup_logging(self):
         """
         Set up the logging configuration.
@@ -164,25 +619,42 @@ class ProxyServer:
             sys.exit(1)
 
         with open(self.blacklist, "r", encoding="utf-8") as f:
-            self.blocked = [line.rstrip().encode() for line in f]
+            self.blocked = tuple(line.rstrip().encode() for line in f)
 
     async def run(self):
         """
         Start the proxy server and run it until it is stopped.
 
-        This method starts the proxy server by calling
-        `asyncio.start_server` with the `handle_connection` method as the
-        protocol handler. The server is then started with the `serve_forever`
-        method.
+        This method starts the proxy server by calling `start` and then
+        serves connections with the `serve_forever` method.
+        """
+        await self.start()
+        await self.server.serve_forever()
+
+    async def start(self):
+        """
+        Start listening without blocking.
+
+        This method calls `asyncio.start_server` with the `handle_connection`
+        method as the protocol handler and starts the background tasks.
         """
         self.print_banner()
         if not self.quiet:
             asyncio.create_task(self.display_stats())
-        self.server = await asyncio.start_server(
-            self.handle_connection, self.host, self.port
-        )
+        if self.upstreams:
+            self.upstreams.start()
+        if self.sock is not None:
+            # У каждого цикла свой дескриптор общего сокета, чтобы закрытие
+            # сервера в одном потоке не ломало остальные
+            self.server = await asyncio.start_server(
+                self.handle_connection, sock=self.sock.dup()
+            )
+        else:
+            self.server = await asyncio.start_server(
+                self.handle_connection, self.host, self.port,
+                reuse_port=self.reuse_port or None,
+            )
         asyncio.create_task(self.cleanup_tasks())
-        await self.server.serve_forever()
 
     def print_banner(self):
         """
@@ -215,6 +687,11 @@ class ProxyServer:
             self.print(
                 f"\033[92m[INFO]:\033[97m Blacklist содержит {len(self.blocked)} доменов"
             )
+        if self.upstreams:
+            self.print(
+                f"\033[92m[INFO]:\033[97m Upstreams ({self.upstreams.balance}): "
+                + ", ".join(u.spec for u in self.upstreams.upstreams)
+            )
         self.print(
             "\033[92m[INFO]:\033[97m Чтобы закрыть это, нажми Ctrl+C")
         if self.log_err_file:
@@ -231,28 +708,43 @@ class ProxyServer:
             await asyncio.sleep(1)
             current_time = time.time()
 
+            workers = list(self.workers)
+            traffic_in = sum(w.traffic_in for w in workers)
+            traffic_out = sum(w.traffic_out for w in workers)
+
             if self.last_time is not None:
                 time_diff = current_time - self.last_time
-                self.speed_in = (self.traffic_in -
+                self.speed_in = (traffic_in -
                                  self.last_traffic_in) * 8 / time_diff
                 self.speed_out = (
-                    (self.traffic_out - self.last_traffic_out) * 8 / time_diff
+                    (traffic_out - self.last_traffic_out) * 8 / time_diff
                 )
 
-            self.last_traffic_in = self.traffic_in
-            self.last_traffic_out = self.traffic_out
+            self.last_traffic_in = traffic_in
+            self.last_traffic_out = traffic_out
             self.last_time = current_time
 
             stats = (
                 f"\033[92m[STATS]:\033[0m "
-                f"\033[97mConns: \033[93m{self.total_connections}\033[0m | "
-                f"\033[97mMiss: \033[92m{self.allowed_connections}\033[0m | "
-                f"\033[97mUnblock: \033[91m{self.blocked_connections}\033[0m | "
-                f"\033[97mDL: \033[96m{self.format_size(self.traffic_in)}\033[0m | "
-                f"\033[97mUL: \033[96m{self.format_size(self.traffic_out)}\033[0m | "
+                f"\033[97mConns: \033[93m{sum(w.total_connections for w in workers)}\033[0m | "
+                f"\033[97mMiss: \033[92m{sum(w.allowed_connections for w in workers)}\033[0m | "
+                f"\033[97mUnblock: \033[91m{sum(w.blocked_connections for w in workers)}\033[0m | "
+                f"\033[97mDL: \033[96m{self.format_size(traffic_in)}\033[0m | "
+                f"\033[97mUL: \033[96m{self.format_size(traffic_out)}\033[0m | "
                 f"\033[97mSpeed DL: \033[96m{self.format_speed(self.speed_in)}\033[0m | "
                 f"\033[97mSpeed UL: \033[96m{self.format_speed(self.speed_out)}\033[0m"
             )
+            if len(workers) > 1:
+                stats += f" | \033[97mThreads: \033[93m{len(workers)}\033[0m"
+            if self.verbose:
+                mode = self.scheduler.mode
+                sends = [w.scheduler.stats.get(mode, (0, 0.0)) for w in workers]
+                count = sum(stat[0] for stat in sends)
+                average = sum(stat[1] for stat in sends) / count if count else 0.0
+                stats += (
+                    f" | \033[97mSend ({mode}): "
+                    f"\033[96m{average * 1000:.3f} ms\033[0m"
+                )
             self.print("\u001b[2K" + stats, end="\r", flush=True)
 
     @staticmethod
@@ -283,6 +775,22 @@ class ProxyServer:
             async with self.tasks_lock:
                 self.tasks = [t for t in self.tasks if not t.done()]
 
+    async def open_remote(self, host, port, conn_info):
+        """
+        Open a connection to the target server.
+
+        If upstreams are configured, the connection goes through the upstream
+        pool and the chosen upstream is remembered in `conn_info` so it can be
+        released when the connection ends. Otherwise the target is dialed
+        directly.
+        """
+        if not self.upstreams:
+            return await asyncio.open_connection(host, port)
+        remote_reader, remote_writer, conn_info.upstream = (
+            await self.upstreams.open_connection(host, port)
+        )
+        return remote_reader, remote_writer
+
     async def handle_connection(self, reader, writer):
         """
         Handle a connection from a client.
@@ -293,6 +801,9 @@ class ProxyServer:
         server and starts piping data between the client and the target server.
         """
 
+        conn_key = None
+        remote_writer = None
+        responded = False
         try:
             client_ip, client_port = writer.get_extra_info("peername")
             http_data = await reader.read(1500)
@@ -327,17 +838,20 @@ class ProxyServer:
                 self.active_connections[conn_key] = conn_info
 
             if method == b"CONNECT":
+                # Сначала соединяемся с целью, чтобы ошибку можно было
+                # вернуть клиенту вместо 200
+                remote_reader, remote_writer = await self.open_remote(
+                    host.decode(), port, conn_info
+                )
+
+                responded = True
                 writer.write(b"HTTP/1.1 200 Connection Established\r\n\r\n")
                 await writer.drain()
 
-                remote_reader, remote_writer = await asyncio.open_connection(
-                    host.decode(), port
-                )
-
                 await self.fragment_data(reader, remote_writer)
             else:
-                remote_reader, remote_writer = await asyncio.open_connection(
-                    host.decode(), port
+                remote_reader, remote_writer = await self.open_remote(
+                    host.decode(), port, conn_info
                 )
                 remote_writer.write(http_data)
                 await remote_writer.drain()
@@ -357,11 +871,22 @@ class ProxyServer:
                 ]
             )
         except Exception as e:
-            try:
-                writer.write(b"HTTP/1.1 500 Internal Server Error\r\n\r\n")
-                await writer.drain()
-            except Exception:
-                pass
+            if not responded:
+                try:
+                    if isinstance(e, (OSError, asyncio.TimeoutError)):
+                        writer.write(b"HTTP/1.1 502 Bad Gateway\r\n\r\n")
+                    else:
+                        writer.write(b"HTTP/1.1 500 Internal Server Error\r\n\r\n")
+                    await writer.drain()
+                except Exception:
+                    pass
+            if remote_writer is not None:
+                remote_writer.close()
+            if conn_key is not None:
+                async with self.connections_lock:
+                    failed = self.active_connections.pop(conn_key, None)
+                if failed and self.upstreams:
+                    self.upstreams.release(failed.upstream)
             try:
                 host_err = host
             except Exception:
@@ -413,6 +938,8 @@ class ProxyServer:
                 conn_info: ConnectionInfo = self.active_connections.pop(
                     conn_key, None)
                 if conn_info:
+                    if self.upstreams:
+                        self.upstreams.release(conn_info.upstream)
                     self.logger.info(
                         "%s %s %s %s",
                         conn_info.start_time, conn_info.src_ip, conn_info.method, conn_info.dst_domain
@@ -467,8 +994,14 @@ class ProxyServer:
             )
             data = data[chunk_len:]
 
-        writer.write(b"".join(parts))
-        await writer.drain()
+        try:
+            self.scheduler.tune(writer)
+        except OSError as e:
+            if self.verbose:
+                self.print(
+                    f"\033[93m[DEBUG]:\033[97m Socket options not applied: {e}\033[0m")
+
+        await self.scheduler.send(writer, parts)
 
     async def shutdown(self):
         """
@@ -480,10 +1013,81 @@ class ProxyServer:
         if self.server:
             self.server.close()
             await self.server.wait_closed()
+        if self.upstreams:
+            self.upstreams.stop()
         for task in self.tasks:
             task.cancel()
 
 
+class ProxyWorker(threading.Thread):
+    """
+    Run an extra ProxyServer on its own event loop in a separate thread.
+
+    The server is created inside the thread, so its locks, tasks and
+    connection table belong to that thread's loop only. `started` is set
+    once the server listens or fails to start; in the latter case `error`
+    holds the exception.
+
+    Parameters:
+        make_server (callable): Returns a new ProxyServer
+        loop_factory (callable): Event loop factory, None for asyncio
+    """
+
+    def __init__(self, make_server, loop_factory=None):
+        super().__init__(daemon=True)
+        self.make_server = make_server
+        self.loop_factory = loop_factory or asyncio.new_event_loop
+        self.loop = None
+        self.task = None
+        self.error = None
+        self.started = threading.Event()
+        self.stopping = threading.Event()
+
+    def run(self):
+        try:
+            self.loop = self.loop_factory()
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self.serve())
+            finally:
+                self.loop.close()
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+        finally:
+            self.started.set()
+
+    async def serve(self):
+        self.task = asyncio.current_task()
+        # stop() мог быть вызван до того, как задача появилась
+        if self.stopping.is_set():
+            return
+        try:
+            server = self.make_server()
+            await server.start()
+        except Exception as e:
+            self.error = e
+            return
+        finally:
+            self.started.set()
+        try:
+            await server.server.serve_forever()
+        except asyncio.CancelledError:
+            await server.shutdown()
+
+    def stop(self):
+        """
+        Cancel the worker from another thread. Safe to call at any time.
+        """
+        self.stopping.set()
+        if self.loop is not None and self.task is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.task.cancel)
+            except RuntimeError:
+                # Цикл уже закрыт
+                pass
+
+
 class ProxyApplication:
     @staticmethod
     def parse_args():
@@ -516,6 +1120,65 @@ class ProxyApplication:
             help="Show more info (only for devs)",
         )
 
+        parser.add_argument(
+            "--upstream",
+            action="append",
+            default=[],
+            help="Upstream for outgoing connections: http://host:port, "
+            "socks5://host:port or direct://source_ip (can be repeated)",
+        )
+        parser.add_argument(
+            "--balance",
+            choices=["least_conn", "ewma"],
+            default="least_conn",
+            help="Upstream load balancing strategy",
+        )
+        parser.add_argument(
+            "--health_interval",
+            type=float,
+            default=10,
+            help="Seconds between upstream health checks",
+        )
+        parser.add_argument(
+            "--warm",
+            type=int,
+            default=0,
+            help="Idle connections kept open to each upstream proxy "
+            "(split between threads with --threads)",
+        )
+
+        parser.add_argument(
+            "--send_mode",
+            choices=["joined", "segments"],
+            default="joined",
+            help="Send fragmented hello as one write or one TCP segment per record",
+        )
+        parser.add_argument(
+            "--pacing",
+            type=int,
+            default=0,
+            help="Pause between records in microseconds (ignored in joined mode)",
+        )
+        parser.add_argument(
+            "--sndbuf", type=int, required=False,
+            help="SO_SNDBUF for connections whose hello is fragmented"
+        )
+
+        parser.add_argument(
+            "--loop",
+            choices=["asyncio", "uvloop"],
+            default="asyncio",
+            help="Event loop implementation (uvloop falls back to asyncio if missing)",
+        )
+
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=1,
+            help="Number of event loop threads (for free-threaded Python); "
+            "each thread balances and health-checks upstreams on its own",
+        )
+
         autostart_group = parser.add_mutually_exclusive_group()
         autostart_group.add_argument(
             "--install",
@@ -528,95 +1191,181 @@ class ProxyApplication:
             help="Remove proxy from Windows autostart (only for EXE)",
         )
 
-        return parser.parse_args()
+        args = parser.parse_args()
+        if args.threads < 1:
+            parser.error("--threads must be at least 1")
+        return args
 
     @staticmethod
-    def manage_autostart(action="install"):
-        """Manage proxy autostart on Windows"""
-
-        if sys.platform != "win32":
-            print(
-                "\033[91m[ERROR]:\033[97m Autostart only available on Windows")
-            return
-
-        app_name = "NoDPIProxy"
-        exe_path = sys.executable
+    def load_platform():
+        """
+        Import the platform integration module on first use, so that
+        Windows-only dependencies are never loaded elsewhere.
+        """
+        if sys.platform == "win32":
+            import platform_windows as system
+        else:
+            import platform_posix as system
+        return system
 
-        try:
-            key = winreg.HKEY_CURRENT_USER  # pylint: disable=possibly-used-before-assignment
-            reg_path = r"Software\Microsoft\Windows\CurrentVersion\Run"
-
-            if action == "install":
-                with winreg.OpenKey(key, reg_path, 0, winreg.KEY_WRITE) as regkey:
-                    winreg.SetValueEx(
-                        regkey,
-                        app_name,
-                        0,
-                        winreg.REG_SZ,
-                        f'"{exe_path}" --blacklist "{os.path.dirname(exe_path)}/blacklist.txt"',
-                    )
+    @staticmethod
+    def loop_factory(name):
+        """
+        Return the event loop factory selected with --loop, or None for the
+        default asyncio loop. Falls back to asyncio when uvloop is missing.
+        """
+        if name == "uvloop":
+            try:
+                import uvloop
+                return uvloop.new_event_loop
+            except ImportError:
                 print(
-                    f"\033[92m[INFO]:\033[97m Added to autostart: {exe_path}")
-
-            elif action == "uninstall":
-                try:
-                    with winreg.OpenKey(key, reg_path, 0, winreg.KEY_WRITE) as regkey:
-                        winreg.DeleteValue(regkey, app_name)
-                    print("\033[92m[INFO]:\033[97m Removed from autostart")
-                except FileNotFoundError:
-                    print("\033[91m[ERROR]: Not found in autostart\033[0m")
-
-        except PermissionError:
-            print("\033[91m[ERROR]: Access denied. Run as administrator\033[0m")
-        except Exception as e:
-            print(f"\033[91m[ERROR]: Autostart operation failed: {e}\033[0m")
+                    "\033[93m[WARNING]:\033[97m uvloop is not installed, using asyncio\033[0m")
+        return None
 
     @classmethod
-    async def run(cls):
+    async def run(cls, args, loop_factory=None):
 
         logging.getLogger("asyncio").setLevel(logging.CRITICAL)
 
-        args = cls.parse_args()
+        system = cls.load_platform()
+        system.enable_ansi()
 
         if args.install or args.uninstall:
             if getattr(sys, 'frozen', False):
                 if args.install:
-                    cls.manage_autostart("install")
+                    system.manage_autostart("install")
                 elif args.uninstall:
-                    cls.manage_autostart("uninstall")
+                    system.manage_autostart("uninstall")
                 sys.exit(0)
             else:
                 print(
                     "\033[91m[ERROR]: Autostart works only in EXE version\033[0m")
                 sys.exit(1)
 
-        proxy = ProxyServer(
-            args.host,
-            args.port,
-            args.blacklist,
-            args.log_access,
-            args.log_error,
-            args.no_blacklist,
-            args.quiet,
-            args.verbose,
-        )
+        def make_upstreams(index=0):
+            if not args.upstream:
+                return None
+            # У каждого потока свой пул: делим --warm между ними, чтобы
+            # на апстрим в сумме держалось ровно --warm соединений
+            warm = args.warm // args.threads + (index < args.warm % args.threads)
+            return UpstreamPool(
+                args.upstream,
+                balance=args.balance,
+                health_interval=args.health_interval,
+                warm=warm,
+            )
+
+        try:
+            upstreams = make_upstreams()
+        except ValueError as e:
+            print(f"\033[91m[ERROR]: {e}\033[0m")
+            sys.exit(1)
+
+        reuse_port = False
+        sock = None
+        if args.threads > 1:
+            if hasattr(socket, "SO_REUSEPORT") and sys.platform.startswith("linux"):
+                # Отдельный accept-сокет на поток, ядро распределяет соединения.
+                # macOS и BSD тоже знают SO_REUSEPORT, но отдают все соединения
+                # одному сокету
+                reuse_port = True
+            else:
+                # Один общий сокет, из которого принимают все циклы
+                sock = socket.create_server((args.host, args.port))
+            if getattr(sys, "_is_gil_enabled", lambda: True)() and not args.quiet:
+                print(
+                    "\033[93m[WARNING]:\033[97m The GIL is enabled, "
+                    "threads will not run in parallel\033[0m")
+
+        def make_proxy(primary=None, index=0):
+            return ProxyServer(
+                args.host,
+                args.port,
+                args.blacklist,
+                args.log_access,
+                args.log_error,
+                args.no_blacklist,
+                args.quiet if primary is None else True,
+                args.verbose,
+                upstreams if primary is None else make_upstreams(index),
+                SendScheduler(args.send_mode, args.pacing, args.sndbuf),
+                primary,
+                reuse_port,
+                sock,
+            )
+
+        proxy = make_proxy()
+
+        workers = [
+            ProxyWorker(lambda index=index: make_proxy(proxy, index), loop_factory)
+            for index in range(1, args.threads)
+        ]
+        for worker in workers:
+            worker.start()
+
+        loop = asyncio.get_running_loop()
+        for worker in workers:
+            started = await loop.run_in_executor(None, worker.started.wait, 10)
+            if not started or worker.error is not None:
+                reason = worker.error or "timed out"
+                print(
+                    f"\033[91m[ERROR]: Worker thread failed to start: {reason}\033[0m")
+                proxy.logger.error("Worker thread failed to start: %s", reason)
+                for other in workers:
+                    other.stop()
+                for other in workers:
+                    other.join(timeout=5)
+                if sock is not None:
+                    sock.close()
+                sys.exit(1)
+
+        main_task = asyncio.current_task()
+
+        def on_exit():
+            system.set_proxy(False)
+            loop.call_soon_threadsafe(main_task.cancel)
 
-        proxy.set_proxy(True, "127.0.0.1:8881")
-        win32api.SetConsoleCtrlHandler(proxy.on_exit, True)
+        system.set_proxy(True, "127.0.0.1:8881")
+        system.install_exit_handler(on_exit)
 
         try:
             await proxy.run()
         except asyncio.CancelledError:
-            proxy.set_proxy(False)
+            system.set_proxy(False)
+            for worker in workers:
+                worker.stop()
             await proxy.shutdown()
+            for worker in workers:
+                worker.join(timeout=5)
+            if sock is not None:
+                sock.close()
             proxy.print("\n\n\033[92m[INFO]:\033[97m Shutting down proxy...")
             try:
                 sys.exit(0)
             except asyncio.CancelledError:
                 pass
 
+    @classmethod
+    def main(cls):
+        args = cls.parse_args()
+        loop_factory = cls.loop_factory(args.loop)
+        try:
+            if loop_factory is None:
+                asyncio.run(cls.run(args))
+            elif sys.version_info >= (3, 11):
+                with asyncio.Runner(loop_factory=loop_factory) as runner:
+                    runner.run(cls.run(args, loop_factory))
+            else:
+                loop = loop_factory()
+                asyncio.set_event_loop(loop)
+                try:
+                    loop.run_until_complete(cls.run(args, loop_factory))
+                finally:
+                    loop.close()
+        except KeyboardInterrupt:
+            pass
+
+
 if __name__ == "__main__":
-    try:
-        asyncio.run(ProxyApplication.run())
-    except KeyboardInterrupt:
-        pass
+    ProxyApplication.main()
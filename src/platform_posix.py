@@ -0,0 +1,34 @@
+"""
+POSIX counterpart of platform_windows: there is no system proxy to manage
+and shutdown is driven by signals.
+"""
+
+import asyncio
+import signal
+
+
+def enable_ansi():
+    pass
+
+
+def set_proxy(enable: bool, proxy: str = "127.0.0.1:8881"):
+    """
+    System proxy settings are left to the user (browser or environment).
+    """
+
+
+def install_exit_handler(callback):
+    """
+    Call `callback` on SIGTERM and SIGHUP.
+
+    Must be called from a running event loop. SIGINT is left to asyncio,
+    which turns Ctrl+C into cancellation of the main task.
+    """
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGHUP):
+        loop.add_signal_handler(sig, callback)
+
+
+def manage_autostart(action="install"):
+    print(
+        "\033[91m[ERROR]:\033[97m Autostart only available on Windows")
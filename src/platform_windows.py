@@ -0,0 +1,95 @@
+"""
+Windows integration: system proxy settings, console close handling and
+autostart through the registry.
+"""
+
+import ctypes
+import ctypes.wintypes
+import os
+import sys
+import winreg
+
+import win32api
+
+CTRL_C_EVENT = 0
+CTRL_BREAK_EVENT = 1
+CTRL_CLOSE_EVENT = 2
+CTRL_LOGOFF_EVENT = 5
+CTRL_SHUTDOWN_EVENT = 6
+
+
+def enable_ansi():
+    """
+    Enable ANSI escape sequences in the Windows console.
+    """
+    os.system("")
+
+
+def set_proxy(enable: bool, proxy: str = "127.0.0.1:8881"):
+    INTERNET_SETTINGS = r"Software\Microsoft\Windows\CurrentVersion\Internet Settings"
+    key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, INTERNET_SETTINGS, 0, winreg.KEY_SET_VALUE)
+
+    winreg.SetValueEx(key, "ProxyEnable", 0, winreg.REG_DWORD, 1 if enable else 0)
+    if enable:
+        winreg.SetValueEx(key, "ProxyServer", 0, winreg.REG_SZ, proxy)
+    winreg.CloseKey(key)
+
+    INTERNET_OPTION_SETTINGS_CHANGED = 39
+    INTERNET_OPTION_REFRESH = 37
+
+    internet_set_option = ctypes.windll.Wininet.InternetSetOptionW
+
+    # Уведомить систему о том, что настройки были изменены
+    internet_set_option(0, INTERNET_OPTION_SETTINGS_CHANGED, 0, 0)
+    internet_set_option(0, INTERNET_OPTION_REFRESH, 0, 0)
+
+
+def install_exit_handler(callback):
+    """
+    Call `callback` when the console window is closed.
+
+    The handler runs on a separate thread created by Windows.
+    """
+    def on_exit(dwCtrlType):
+        if dwCtrlType == CTRL_CLOSE_EVENT:
+            callback()
+            return True
+        return False
+
+    win32api.SetConsoleCtrlHandler(on_exit, True)
+
+
+def manage_autostart(action="install"):
+    """Manage proxy autostart on Windows"""
+
+    app_name = "NoDPIProxy"
+    exe_path = sys.executable
+
+    try:
+        key = winreg.HKEY_CURRENT_USER
+        reg_path = r"Software\Microsoft\Windows\CurrentVersion\Run"
+
+        if action == "install":
+            with winreg.OpenKey(key, reg_path, 0, winreg.KEY_WRITE) as regkey:
+                winreg.SetValueEx(
+                    regkey,
+                    app_name,
+                    0,
+                    winreg.REG_SZ,
+                    f'"{exe_path}" --blacklist "{os.path.dirname(exe_path)}/blacklist.txt"',
+                )
+            print(
+                f"\033[92m[INFO]:\033[97m Added to autostart: {exe_path}")
+
+        elif action == "uninstall":
+            try:
+                with winreg.OpenKey(key, reg_path, 0, winreg.KEY_WRITE) as regkey:
+                    winreg.DeleteValue(regkey, app_name)
+                print("\033[92m[INFO]:\033[97m Removed from autostart")
+            except FileNotFoundError:
+                print("\033[91m[ERROR]: Not found in autostart\033[0m")
+
+    except PermissionError:
+        print("\033[91m[ERROR]: Access denied. Run as administrator\033[0m")
+    except Exception as e:
+        print(f"\033[91m[ERROR]: Autostart operation failed: {e}\033[0m")